@@ -2,15 +2,30 @@
 # Terminal hub + graph dungeon + knapsack loot + stone duel ritual
 # This project is shared for educational and learning purposes.
 # Use it, learn from it, and build something cool.
+import builtins
+import heapq
 import json
 import math
+import os
+import queue
 import random
+import selectors
+import socket
+import sqlite3
+import struct
 import sys
+import threading
 import time
+import uuid
+from array import array
 from pathlib import Path
 from collections import deque
+from itertools import islice
 
 SAVEFILE = "goblin_save.json"
+POOLFILE = "goblin_pool.json"
+HISTORYFILE = "goblin_history.db"
+MOVESFILE = "goblin_moves.bin"
 
 TITLE = r"""
    ____       _     _ _        ____                 _     
@@ -51,6 +66,156 @@ def slow_print(text: str, delay: float = 0.02, end: str = "\n"):
     sys.stdout.write(end)
     sys.stdout.flush()
 
+# ----------------------------
+# Spectators (watch a live session over a local socket)
+# ----------------------------
+# Everything written to stdout is also appended once to a shared buffer made of
+# fixed-size blocks. One sender thread hands every watcher memoryview slices of
+# those blocks, so there is no per-watcher copy or re-render. Only the last
+# SPECTATE_BACKLOG blocks are kept. A watcher that falls further behind than that
+# jumps ahead to the oldest kept byte, and the player never waits on it.
+SPECTATE_BLOCK = 64 * 1024
+SPECTATE_BACKLOG = 16
+
+spectate = {
+    "blocks": [],     # bytearrays of SPECTATE_BLOCK bytes, never resized
+    "base": 0,        # stream offset of blocks[0]
+    "end": 0,         # stream offset one past the last byte written
+    "watchers": {},   # socket -> stream offset of the next byte to send it
+    "skipped": 0,     # times a slow watcher was moved ahead
+}
+_spectate_lock = threading.Lock()
+
+def spectate_append(data):
+    with _spectate_lock:
+        while data:
+            fill = spectate["end"] % SPECTATE_BLOCK
+            if fill == 0:
+                spectate["blocks"].append(bytearray(SPECTATE_BLOCK))
+                if len(spectate["blocks"]) > SPECTATE_BACKLOG:
+                    spectate["blocks"].pop(0)
+                    spectate["base"] += SPECTATE_BLOCK
+            take = min(len(data), SPECTATE_BLOCK - fill)
+            # slice assignment of the same length never resizes the block
+            spectate["blocks"][-1][fill:fill + take] = data[:take]
+            spectate["end"] += take
+            data = data[take:]
+
+def _drop_watcher(sel, sock):
+    spectate["watchers"].pop(sock, None)
+    try:
+        sel.unregister(sock)
+    except (KeyError, ValueError):
+        pass
+    sock.close()
+
+def _spectate_pump(sel):
+    with _spectate_lock:
+        blocks = list(spectate["blocks"])
+        base, end = spectate["base"], spectate["end"]
+    watchers = spectate["watchers"]
+    for sock, offset in list(watchers.items()):
+        if offset < base:
+            offset = base
+            spectate["skipped"] += 1
+        try:
+            while offset < end:
+                i, fill = divmod(offset - base, SPECTATE_BLOCK)
+                stop = min(SPECTATE_BLOCK, end - base - i * SPECTATE_BLOCK)
+                with memoryview(blocks[i]) as view:
+                    sent = sock.send(view[fill:stop])
+                offset += sent
+                if sent < stop - fill:
+                    break
+        except BlockingIOError:
+            pass
+        except OSError:
+            _drop_watcher(sel, sock)
+            continue
+        watchers[sock] = offset
+
+def _spectate_loop(server):
+    sel = selectors.DefaultSelector()
+    sel.register(server, selectors.EVENT_READ)
+    while True:
+        for key, _ in sel.select(timeout=0.05):
+            if key.fileobj is not server:
+                # watchers only ever say goodbye; reap them even when nothing is being sent
+                try:
+                    if not key.fileobj.recv(4096):
+                        _drop_watcher(sel, key.fileobj)
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    _drop_watcher(sel, key.fileobj)
+                continue
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                continue
+            sock.setblocking(False)
+            sel.register(sock, selectors.EVENT_READ)
+            with _spectate_lock:
+                spectate["watchers"][sock] = spectate["base"]  # catch up on the backlog
+        _spectate_pump(sel)
+
+class _SpectatedStdout:
+    # stands in for sys.stdout and copies every write into the spectator buffer
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, text):
+        self.out.write(text)
+        spectate_append(text.encode("utf-8"))
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
+
+def _spectated_input(prompt=""):
+    # input() on a terminal writes its prompt below sys.stdout, and the player's
+    # typing is only echoed by the terminal, so both are copied to watchers here
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    line = builtins.input()
+    spectate_append((line + "\n").encode("utf-8"))
+    return line
+
+def _unix_server(path):
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # left behind by a session that is gone
+        else:
+            raise OSError(f"{path} is in use by another session")
+        finally:
+            probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1024)
+    return server
+
+def start_spectating(address):
+    # address: a TCP port on localhost, or a path for a Unix socket
+    global input
+    try:
+        if str(address).isdigit():
+            server = socket.create_server(("127.0.0.1", int(address)), backlog=1024)
+            how = f"nc 127.0.0.1 {address}"
+        else:
+            server = _unix_server(str(address))
+            how = f"nc -U {address}"
+    except OSError as e:
+        print("[Could not start spectator mode:]", e)
+        return
+    server.setblocking(False)
+    threading.Thread(target=_spectate_loop, args=(server,), name="spectate", daemon=True).start()
+    sys.stdout = _SpectatedStdout(sys.stdout)
+    input = _spectated_input
+    print(f"[Spectators can watch with: {how}]")
+
 def divider():
     print("\n" + "-" * 60 + "\n")
 
@@ -72,15 +237,23 @@ player = {
 # ----------------------------
 # Save / Load
 # ----------------------------
-def save_game(state, filename=SAVEFILE):
+def save_game(state, filename=SAVEFILE, quiet=False):
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
-        print(f"[Game saved to {filename}]")
+        # write next to the old save and swap, so a crash never leaves half a file
+        tmp = filename + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pack_state(state), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, filename)
+        if not quiet:
+            print(f"[Game saved to {filename}]")
     except Exception as e:
-        print("[Failed to save game:]", e)
+        if not quiet:
+            print("[Failed to save game:]", e)
+        return e
+    return None
 
 def load_game(filename=SAVEFILE):
+    wait_for_saves()
     if not Path(filename).is_file():
         print("[No save file found.]")
         return None
@@ -90,12 +263,118 @@ def load_game(filename=SAVEFILE):
         if not isinstance(data, dict) or "player" not in data:
             print("[Save file looks corrupt.]")
             return None
+        if data.get("dungeon"):
+            data["dungeon"] = unpack_dungeon(data["dungeon"])
         print(f"[Loaded game from {filename}]")
         return data
     except Exception as e:
         print("[Failed to load game:]", e)
         return None
 
+# Seeded dungeons are saved as their seed plus what the player changed
+# (cleared rooms and tunnels moved by dungeon_shift); tunnels and rooms are
+# regenerated on load. The map layout is never saved; ensure_layout rebuilds it
+# the first time the map is drawn. Imported dungeons have no seed and are saved
+# in full.
+def pack_dungeon(d):
+    if "seed" not in d or "params" not in d:
+        return {k: v for k, v in d.items() if k != "layout"}
+    packed = {k: v for k, v in d.items() if k not in ("adj", "rooms", "layout")}
+    packed["cleared"] = sorted(int(k) for k, room in d["rooms"].items() if room.get("cleared"))
+    return packed
+
+def _replay_shift(adj, kind, a, b):
+    if kind == "open":
+        adj[a].append(b)
+        adj[b].append(a)
+    else:
+        adj[a].remove(b)
+        adj[b].remove(a)
+
+def unpack_dungeon(data):
+    if "adj" in data:
+        return data
+    d = {k: v for k, v in data.items() if k != "cleared"}
+    num_rooms, extra_edges = d["params"]
+    adj = generate_base_graph(d["seed"], num_rooms, extra_edges)
+    for kind, a, b in d.get("shifts", []):
+        _replay_shift(adj, kind, a, b)
+    d["adj"] = adj
+    d["rooms"] = {i: generate_room(d["seed"], num_rooms, d["exit"], i, d["start"]) for i in range(num_rooms)}
+    for rid in data.get("cleared", []):
+        d["rooms"][rid]["cleared"] = True
+    return d
+
+def pack_state(state):
+    if not state.get("dungeon"):
+        return state
+    return {**state, "dungeon": pack_dungeon(state["dungeon"])}
+
+# ----------------------------
+# Background saves (snapshot now, write later)
+# ----------------------------
+# Dungeon rows are copy-on-write: code that changes a room or its tunnels puts a
+# new list/dict into d["adj"] / d["rooms"] instead of editing the old one in place.
+# A snapshot can then share every row with the live game and only copy the outer
+# containers, and the worker serializes it while play goes on.
+AUTOSAVE_EVERY = 10  # moves between autosaves in the dungeon
+
+_autosave = {"pending": None, "busy": False, "error": None}
+_autosave_cond = threading.Condition()
+_autosave_worker = None
+
+def snapshot_state(state):
+    snap = dict(state)
+    p = state["player"]
+    snap["player"] = {**p, "inventory": list(p["inventory"])}
+    d = state.get("dungeon")
+    if d:
+        snap["dungeon"] = {
+            **{k: v for k, v in d.items() if k not in ("trail_ring", "layout")},
+            "adj": list(d["adj"]),
+            "rooms": dict(d["rooms"]),
+            "trail": breadcrumbs(d),
+        }
+    return snap
+
+def _autosave_loop():
+    while True:
+        with _autosave_cond:
+            while _autosave["pending"] is None:
+                _autosave_cond.wait()
+            snap, filename = _autosave["pending"]
+            _autosave["pending"] = None
+            _autosave["busy"] = True
+        error = save_game(snap, filename, quiet=True)
+        with _autosave_cond:
+            if error:
+                # the game loop shows it; printing here would land mid-screen
+                _autosave["error"] = error
+            _autosave["busy"] = False
+            _autosave_cond.notify_all()
+
+def save_in_background(state, filename=SAVEFILE):
+    # at most one write in flight; a newer snapshot replaces one still waiting
+    global _autosave_worker
+    snap = snapshot_state(state)
+    with _autosave_cond:
+        if _autosave_worker is None:
+            _autosave_worker = threading.Thread(target=_autosave_loop, name="autosave", daemon=True)
+            _autosave_worker.start()
+        _autosave["pending"] = (snap, filename)
+        _autosave_cond.notify_all()
+
+def report_save_errors():
+    with _autosave_cond:
+        error, _autosave["error"] = _autosave["error"], None
+    if error:
+        slow_print(f"[Failed to save game: {error}]")
+
+def wait_for_saves():
+    with _autosave_cond:
+        while _autosave["pending"] is not None or _autosave["busy"]:
+            _autosave_cond.wait()
+
 # ----------------------------
 # Combat (number battle vibe)
 # ----------------------------
@@ -146,8 +425,117 @@ ITEM_POOL = [
     ("Cursed Mirror", 2, 30),
 ]
 
-def generate_room_loot(count: int = 6):
-    return random.sample(ITEM_POOL, k=count)
+# ----------------------------
+# Loot tables (weighted by rarity, deeper = richer)
+# ----------------------------
+ITEM_RARITY = {
+    "Rusty Coins": "common",
+    "Silver Ring": "common",
+    "Bone Charm": "common",
+    "Small Gem": "uncommon",
+    "Ancient Tome": "uncommon",
+    "Iron Dagger": "uncommon",
+    "Knight Helm": "rare",
+    "Cursed Mirror": "rare",
+    "Jeweled Crown": "rare",
+    "Gold Idol": "legendary",
+}
+RARITY_WEIGHTS = {"common": 60, "uncommon": 25, "rare": 10, "legendary": 4}
+LOOT_POOLS = {"loot": ITEM_POOL}  # room type -> items it can drop
+
+_loot_tables = {}  # (depth, room_type) -> compiled alias table
+
+def loot_weight(item, depth=0):
+    # every sigil you hold tilts the odds towards the rarer tiers
+    tier = ITEM_RARITY.get(item[0], "common")
+    rank = list(RARITY_WEIGHTS).index(tier)
+    return RARITY_WEIGHTS[tier] * (1 + 0.5 * depth) ** rank
+
+def build_loot_table(items, weights):
+    # Vose's alias method: O(n) to build, O(1) per weighted draw
+    n = len(items)
+    total = float(sum(weights))
+    if n == 0 or total <= 0:
+        raise ValueError("loot table needs at least one item with positive weight")
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    for i in small + large:
+        prob[i] = 1.0
+    live = sum(1 for w in weights if w > 0)
+    return {"items": list(items), "weights": list(weights), "prob": prob, "alias": alias, "live": live}
+
+def loot_table(depth=0, room_type="loot"):
+    key = (depth, room_type)
+    table = _loot_tables.get(key)
+    if table is None:
+        items = LOOT_POOLS[room_type]
+        table = build_loot_table(items, [loot_weight(it, depth) for it in items])
+        _loot_tables[key] = table
+    return table
+
+LOOT_GRID_BITS = 16  # alias draws read 16 random bits each
+
+def _alias_grid(table):
+    # the alias table evaluated at every 16-bit draw, so a whole batch of draws is one
+    # randbytes call and a lookup per byte pair instead of a random() and a compare each
+    grid = table.get("grid")
+    if grid is None:
+        prob, alias = table["prob"], table["alias"]
+        n = len(prob)
+        size = 1 << LOOT_GRID_BITS
+        grid = []
+        for b in range(size):
+            u = (b + 0.5) * n / size
+            i = int(u)
+            grid.append(i if u - i < prob[i] else alias[i])
+        table["grid"] = grid
+    return grid
+
+def _draw_weighted_keys(table, k, skip=()):
+    # Efraimidis–Spirakis: top-k of u ** (1 / w) among the items not already picked
+    keyed = [(random.random() ** (1.0 / w), i)
+             for i, w in enumerate(table["weights"]) if w > 0 and i not in skip]
+    return [i for _, i in heapq.nlargest(k, keyed)]
+
+def draw_loot_batch(table, k, rooms):
+    # weighted samples without replacement for many rooms: one pass of alias draws for
+    # the lot, then each room keeps the first k distinct items of its own window
+    items = table["items"]
+    k = min(k, table["live"])
+    if k <= 0:
+        return [[] for _ in range(rooms)]
+    grid = _alias_grid(table)
+    window = 4 * k
+    draws = map(grid.__getitem__, array("H", random.randbytes(2 * window * rooms)))
+    loot = []
+    for seen in map(dict.fromkeys, zip(*[draws] * window)):
+        if len(seen) < k:
+            # the window ran short: keep drawing for this room where it left off
+            tries = 8 * k + 16
+            while len(seen) < k and tries:
+                tries -= 1
+                seen[grid[random.getrandbits(LOOT_GRID_BITS)]] = None
+            if len(seen) < k:
+                # weights are lopsided enough that repeats keep winning
+                for i in _draw_weighted_keys(table, k - len(seen), seen):
+                    seen[i] = None
+        loot.append([items[i] for i in islice(seen, k)])
+    return loot
+
+def draw_loot(table, k):
+    return draw_loot_batch(table, k, 1)[0]
+
+def generate_room_loot(count: int = 6, depth: int = 0, room_type: str = "loot"):
+    return draw_loot(loot_table(depth, room_type), count)
 
 def show_loot(loot):
     slow_print("\nTorchlight flickers over broken stone. You spot loot:")
@@ -173,7 +561,7 @@ def parse_choices(inp: str, max_index: int):
 
 def event_loot_cache():
     divider()
-    loot = generate_room_loot()
+    loot = generate_room_loot(depth=player["sigils"])
     show_loot(loot)
 
     cap = player["pack_capacity"]
@@ -225,7 +613,7 @@ def event_loot_cache():
 # ----------------------------
 # Stone Duel ritual (terminal port of your rules + goblin strategy)
 # ----------------------------
-def goblin_move_game1(left, right):
+def goblin_move_game1(left, right, rng=random):
     # Parity strategy:
     # If possible, make the resulting position (even, even) for the player.
 
@@ -249,15 +637,25 @@ def goblin_move_game1(left, right):
 
     # Otherwise both are even already (goblin is in a losing position),
     # so any move is "bad" – pick randomly.
-    return random.choice([(1, 0), (0, 1), (1, 1)])
-
-def goblin_move_game2(left, right):
+    return rng.choice([(1, 0), (0, 1), (1, 1)])
+
+_game2_moves = {}  # (min(left, 3), min(right, 3)) -> legal moves, in a fixed order
+
+def game2_moves(left, right):
+    key = (min(left, 3), min(right, 3))
+    moves = _game2_moves.get(key)
+    if moves is None:
+        moves = []
+        for l in range(0, key[0] + 1):
+            for r in range(0, min(3 - l, key[1]) + 1):
+                if l + r >= 1:
+                    moves.append((l, r))
+        _game2_moves[key] = moves
+    return moves
+
+def goblin_move_game2(left, right, rng=random):
     # mod-4 strategy: remove total stones == (left+right) % 4 when possible, else random legal
-    moves = []
-    for l in range(0, min(3, left) + 1):
-        for r in range(0, min(3 - l, right) + 1):
-            if l + r >= 1:
-                moves.append((l, r))
+    moves = game2_moves(left, right)
 
     total = left + right
     if total == 0:
@@ -268,7 +666,7 @@ def goblin_move_game2(left, right):
         for l, r in moves:
             if l + r == target:
                 return (l, r)
-    return random.choice(moves)
+    return rng.choice(moves)
 
 def make_even_in_range(x, lo=7, hi=13):
     if x % 2 == 0:
@@ -278,32 +676,49 @@ def make_even_in_range(x, lo=7, hi=13):
         return x + 1
     return x - 1
 
-def event_goblin_ritual():
-    divider()
-    slow_print("A Goblin Shaman draws a circle in ash.")
-    slow_print("Two piles of magic stones shimmer on the floor.")
-    slow_print("Win the ritual and the dungeon coughs up a Sigil.\n")
-
-    mode = random.choice(["game1", "game2"])  # surprise ritual
-    left = random.randint(7, 13)
-    right = random.randint(7, 13)
+def ritual_start(rng=random):
+    mode = rng.choice(["game1", "game2"])  # surprise ritual
+    left = rng.randint(7, 13)
+    right = rng.randint(7, 13)
 
     # OPTION 0: make Game 1 fair sometimes by forcing (even, even)
-    if mode == "game1" and random.random() < 0.6: # If you want it even more fair, change 0.5 to 0.7 (70% fair starts)
+    if mode == "game1" and rng.random() < 0.6: # If you want it even more fair, change 0.5 to 0.7 (70% fair starts)
         left = make_even_in_range(left, 7, 13)
         right = make_even_in_range(right, 7, 13)
 
     # OPTION 1: make Game 2 fair sometimes by starting on a multiple of 4
-    if mode == "game2" and random.random() < 0.5: # If you want it even more fair, change 0.5 to 0.7 (70% fair starts)
+    if mode == "game2" and rng.random() < 0.5: # If you want it even more fair, change 0.5 to 0.7 (70% fair starts)
         total = left + right
         mod = total % 4
         if mod != 0:
             add = 4 - mod  # 1..3
             # add to a random pile so it doesn't feel patterned
-            if random.random() < 0.5:
+            if rng.random() < 0.5:
                 left += add
             else:
                 right += add
+    return mode, left, right
+
+def ritual_move_error(mode, left, right, l_take, r_take):
+    # None if the move is legal, otherwise what to tell the player
+    if l_take < 0 or r_take < 0:
+        return "No negative numbers, gremlin 😄"
+    if l_take > left or r_take > right:
+        return "Illegal: you can't take more stones than exist."
+    if mode == "game1":
+        if (l_take, r_take) not in [(1, 0), (0, 1), (1, 1)]:
+            return "Illegal in Game 1. Only (1,0) (0,1) (1,1)."
+    elif (l_take + r_take) == 0 or (l_take + r_take) > 3:
+        return "Illegal in Game 2. Must take 1–3 stones total."
+    return None
+
+def event_goblin_ritual():
+    divider()
+    slow_print("A Goblin Shaman draws a circle in ash.")
+    slow_print("Two piles of magic stones shimmer on the floor.")
+    slow_print("Win the ritual and the dungeon coughs up a Sigil.\n")
+
+    mode, left, right = ritual_start()
 
     slow_print(f"Ritual mode: {'Game 1' if mode=='game1' else 'Game 2'}")
     if mode == "game1":
@@ -352,7 +767,7 @@ def event_goblin_ritual():
                 dmg = random.randint(8, 18)
                 player["health"] -= dmg
                 slow_print(f"The ritual backlash hits you for {dmg} damage. (HP: {player['health']})")
-                return "ritual_done"
+                return {"result": "ritual_done", "winner": "goblin", "mode": mode}
 
             turn = "you"
             continue
@@ -366,20 +781,10 @@ def event_goblin_ritual():
                 slow_print("Enter exactly two integers like: 1 0")
                 continue
             l_take, r_take = map(int, parts)
-            if l_take < 0 or r_take < 0:
-                slow_print("No negative numbers, gremlin 😄")
-                continue
-            if l_take > left or r_take > right:
-                slow_print("Illegal: you can't take more stones than exist.")
+            error = ritual_move_error(mode, left, right, l_take, r_take)
+            if error:
+                slow_print(error)
                 continue
-            if mode == "game1":
-                if (l_take, r_take) not in [(1, 0), (0, 1), (1, 1)]:
-                    slow_print("Illegal in Game 1. Only (1,0) (0,1) (1,1).")
-                    continue
-            else:
-                if (l_take + r_take) == 0 or (l_take + r_take) > 3:
-                    slow_print("Illegal in Game 2. Must take 1–3 stones total.")
-                    continue
             break
 
         left -= l_take
@@ -389,11 +794,88 @@ def event_goblin_ritual():
             slow_print("\nYou win the ritual. The ash circle cracks like ice.")
             player["sigils"] += 1
             slow_print(f"You gained a Sigil! (Sigils: {player['sigils']}/3)")
-            return "ritual_done"
+            return {"result": "ritual_done", "winner": "you", "mode": mode}
 
         turn = "goblin"
 
 
+# ----------------------------
+# Ritual batches (many duels at once, for simulators and hosts)
+# ----------------------------
+# One column per field, one slot per duel. Every duel owns its RNG, seeded like
+# the single-duel path: random.seed(s) + event_goblin_ritual() and
+# ritual_batch([s]) produce the same piles, goblin moves and backlash damage.
+RITUAL_MODES = ("game1", "game2")
+TURN_GOBLIN, TURN_YOU, TURN_DONE = 0, 1, 2
+
+def ritual_batch(seeds):
+    batch = {
+        "mode": array("b"),
+        "left": array("h"),
+        "right": array("h"),
+        "turn": array("b"),
+        "winner": array("b"),   # -1 still playing, 0 goblin, 1 you
+        "damage": array("h"),   # backlash taken when the goblin wins
+        "rng": [],
+    }
+    for seed in seeds:
+        rng = random.Random(seed)
+        mode, left, right = ritual_start(rng)
+        batch["mode"].append(RITUAL_MODES.index(mode))
+        batch["left"].append(left)
+        batch["right"].append(right)
+        batch["turn"].append(TURN_GOBLIN)  # goblin starts, as in the single duel
+        batch["winner"].append(-1)
+        batch["damage"].append(0)
+        batch["rng"].append(rng)
+    return batch
+
+def _ritual_finish(batch, i, winner):
+    batch["turn"][i] = TURN_DONE
+    batch["winner"][i] = winner
+    if winner == 0:
+        batch["damage"][i] = batch["rng"][i].randint(8, 18)
+
+def ritual_batch_goblin_step(batch):
+    # every duel waiting on the goblin gets its reply
+    modes, left, right, turn = batch["mode"], batch["left"], batch["right"], batch["turn"]
+    for i in range(len(turn)):
+        if turn[i] != TURN_GOBLIN:
+            continue
+        rng = batch["rng"][i]
+        if modes[i] == 0:
+            l_take, r_take = goblin_move_game1(left[i], right[i], rng)
+        else:
+            l_take, r_take = goblin_move_game2(left[i], right[i], rng)
+        left[i] -= l_take
+        right[i] -= r_take
+        if left[i] + right[i] == 0:
+            _ritual_finish(batch, i, 0)
+        else:
+            turn[i] = TURN_YOU
+
+def ritual_batch_player_step(batch, moves):
+    # moves[i] is (l, r) or None to pass this step; returns one error (or None) per duel
+    modes, left, right, turn = batch["mode"], batch["left"], batch["right"], batch["turn"]
+    errors = [None] * len(turn)
+    for i, move in enumerate(moves):
+        if move is None or turn[i] != TURN_YOU:
+            continue
+        l_take, r_take = move
+        errors[i] = ritual_move_error(RITUAL_MODES[modes[i]], left[i], right[i], l_take, r_take)
+        if errors[i]:
+            continue
+        left[i] -= l_take
+        right[i] -= r_take
+        if left[i] + right[i] == 0:
+            _ritual_finish(batch, i, 1)
+        else:
+            turn[i] = TURN_GOBLIN
+    return errors
+
+def ritual_batch_running(batch):
+    return sum(1 for t in batch["turn"] if t != TURN_DONE)
+
 # ----------------------------
 # Dungeon shift event
 # ----------------------------
@@ -410,8 +892,10 @@ def dungeon_shift(d):
         for _ in range(20):  # try a few times
             a, b = random.sample(range(n), 2)
             if b not in adj[a]:
-                adj[a].append(b)
-                adj[b].append(a)
+                adj[a] = adj[a] + [b]
+                adj[b] = adj[b] + [a]
+                update_layout(d, (a, b))
+                d["shifts"] = d.get("shifts", []) + [["open", a, b]]
                 return f"A hidden tunnel opens between room {a} and room {b}."
         return "You hear stone shift, but nothing new is revealed."
 
@@ -420,17 +904,20 @@ def dungeon_shift(d):
     random.shuffle(candidates)
 
     for u, v in candidates:
-        # temporarily remove edge
-        adj[u].remove(v)
-        adj[v].remove(u)
+        # temporarily remove edge (new rows, the old ones may be in a save snapshot)
+        old_u, old_v = adj[u], adj[v]
+        adj[u] = [x for x in old_u if x != v]
+        adj[v] = [x for x in old_v if x != u]
 
         # check reachability
         if is_reachable(adj, cur, exit_room):
+            update_layout(d, (u, v))
+            d["shifts"] = d.get("shifts", []) + [["collapse", u, v]]
             return f"The ground collapses! A passage between room {u} and room {v} is gone."
 
         # rollback if unfair
-        adj[u].append(v)
-        adj[v].append(u)
+        adj[u] = old_u
+        adj[v] = old_v
 
     return "The dungeon groans, as if it wanted to change… but hesitates."
 
@@ -452,14 +939,74 @@ def bfs_farthest(adj, start):
     far = max(range(len(adj)), key=lambda i: dist[i])
     return far, dist
 
-def generate_dungeon(num_rooms=14, extra_edges=5):
+# type -> (name, desc); "empty" rooms keep their numbered name
+ROOM_KINDS = {
+    "empty": (None, "Cold stone. A draft whispers through cracks."),
+    "exit": ("Exit Gate", "A gate of bone and iron. Three sockets wait for Sigils."),
+    "loot": ("Loot Cache", "Broken crates and glittering scraps."),
+    "ritual": ("Goblin Ritual", "Ash, bones, and a smug little laugh."),
+    "fight": ("Ambush", "Something moves in the dark."),
+}
+
+def make_room(rid, kind="empty", cleared=False):
+    name, desc = ROOM_KINDS[kind]
+    return {
+        "name": name or f"Room {rid}",
+        "desc": desc,
+        "type": kind,
+        "cleared": cleared,
+    }
+
+def make_start_room(rid, cleared=False):
+    # spice names: the entrance is an empty room with its own name
+    room = make_room(rid, "empty", cleared)
+    room["name"] = "Cracked Archway"
+    room["desc"] = "You descend into the Goblin King’s maze. The air tastes like old coins."
+    return room
+
+# Generation draws from a counter-based RNG: every number is a hash of
+# (seed, stream, counter), so any room or tunnel can be rebuilt on its own from
+# the seed, without replaying everything generated before it.
+MASK64 = (1 << 64) - 1
+STREAM_TREE_ORDER = 1
+STREAM_TREE_PARENT = 2
+STREAM_EXTRA_EDGES = 3
+STREAM_ROOM_TYPES = 4
+
+def _mix64(x):
+    # SplitMix64 finalizer
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+def rng_u64(seed, stream, counter):
+    return _mix64(seed ^ _mix64((stream << 40) ^ counter))
+
+def rng_below(seed, stream, counter, n):
+    return rng_u64(seed, stream, counter) % n
+
+def rng_permute(seed, stream, i, n):
+    # i-th entry of a random permutation of range(n), without building it:
+    # a 4-round Feistel network over the next even power of two, cycle-walking
+    # until the result lands inside range(n)
+    half = max(1, ((n - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    x = i
+    while True:
+        left, right = x >> half, x & mask
+        for rnd in range(4):
+            left, right = right, left ^ (rng_u64(seed, stream, (rnd << 32) | right) & mask)
+        x = (left << half) | right
+        if x < n:
+            return x
+
+def generate_base_graph(seed, num_rooms, extra_edges):
     # Start with a random spanning tree to ensure connected
     adj = [[] for _ in range(num_rooms)]
-    nodes = list(range(num_rooms))
-    random.shuffle(nodes)
     for i in range(1, num_rooms):
-        a = nodes[i]
-        b = nodes[random.randrange(0, i)]
+        a = rng_permute(seed, STREAM_TREE_ORDER, i, num_rooms)
+        b = rng_permute(seed, STREAM_TREE_ORDER, rng_below(seed, STREAM_TREE_PARENT, i, i), num_rooms)
         adj[a].append(b)
         adj[b].append(a)
 
@@ -467,54 +1014,41 @@ def generate_dungeon(num_rooms=14, extra_edges=5):
     attempts = 0
     while extra_edges > 0 and attempts < 200:
         attempts += 1
-        a = random.randrange(num_rooms)
-        b = random.randrange(num_rooms)
+        a = rng_below(seed, STREAM_EXTRA_EDGES, 2 * attempts, num_rooms)
+        b = rng_below(seed, STREAM_EXTRA_EDGES, 2 * attempts + 1, num_rooms)
         if a == b or b in adj[a]:
             continue
         adj[a].append(b)
         adj[b].append(a)
         extra_edges -= 1
+    return adj
+
+def generate_room(seed, num_rooms, exit_room, rid, start=0):
+    if rid == exit_room:
+        return make_room(rid, "exit")
+    if rid == start:
+        return make_start_room(rid)
+
+    # assign events (avoid start/exit): 4 loot rooms, 4 ritual rooms, 3 fights
+    rank = rid - (rid > start) - (rid > exit_room)
+    slot = rng_permute(seed, STREAM_ROOM_TYPES, rank, num_rooms - 2)
+    if slot < 4:
+        return make_room(rid, "loot")
+    if slot < 8:
+        return make_room(rid, "ritual")
+    if slot < 11:
+        return make_room(rid, "fight")
+    return make_room(rid, "empty")
+
+def generate_dungeon(num_rooms=14, extra_edges=5, seed=None):
+    if seed is None:
+        seed = random.getrandbits(63)
+    adj = generate_base_graph(seed, num_rooms, extra_edges)
 
     start = 0
     exit_room, dist = bfs_farthest(adj, start)
 
-    # room types
-    rooms = {}
-    for i in range(num_rooms):
-        rooms[i] = {
-            "name": f"Room {i}",
-            "desc": "Cold stone. A draft whispers through cracks.",
-            "type": "empty",
-            "cleared": False,
-        }
-
-    # spice names
-    rooms[start]["name"] = "Cracked Archway"
-    rooms[start]["desc"] = "You descend into the Goblin King’s maze. The air tastes like old coins."
-    rooms[exit_room]["name"] = "Exit Gate"
-    rooms[exit_room]["desc"] = "A gate of bone and iron. Three sockets wait for Sigils."
-    rooms[exit_room]["type"] = "exit"
-
-    # assign events (avoid start/exit)
-    candidates = [i for i in range(num_rooms) if i not in (start, exit_room)]
-    random.shuffle(candidates)
-
-    # 4 loot rooms, 4 ritual rooms, 3 fights
-    for idx, rid in enumerate(candidates):
-        if idx < 4:
-            rooms[rid]["type"] = "loot"
-            rooms[rid]["name"] = "Loot Cache"
-            rooms[rid]["desc"] = "Broken crates and glittering scraps."
-        elif idx < 8:
-            rooms[rid]["type"] = "ritual"
-            rooms[rid]["name"] = "Goblin Ritual"
-            rooms[rid]["desc"] = "Ash, bones, and a smug little laugh."
-        elif idx < 11:
-            rooms[rid]["type"] = "fight"
-            rooms[rid]["name"] = "Ambush"
-            rooms[rid]["desc"] = "Something moves in the dark."
-        else:
-            rooms[rid]["type"] = "empty"
+    rooms = {i: generate_room(seed, num_rooms, exit_room, i, start) for i in range(num_rooms)}
 
     return {
         "adj": adj,
@@ -522,6 +1056,8 @@ def generate_dungeon(num_rooms=14, extra_edges=5):
         "start": start,
         "exit": exit_room,
         "current": start,
+        "seed": seed,
+        "params": [num_rooms, extra_edges],
     }
 
 def is_reachable(adj, start, target):
@@ -540,6 +1076,13 @@ def is_reachable(adj, start, target):
 
     return False
 
+def _room_key(d, rid):
+    # rooms are keyed by int when generated, by str once they went through JSON
+    return str(rid) if isinstance(next(iter(d["rooms"].keys())), str) else rid
+
+def _room_at(d, rid):
+    return d["rooms"][_room_key(d, rid)]
+
 def bfs_within(adj, start, max_depth=2):
     dist = {start: 0}
     q = deque([start])
@@ -571,25 +1114,925 @@ def show_map(state):
     if "exit" in d:
         slow_print(f"Exit Gate: room {d['exit']}")
 
+    print()
+    for line in render_map(d):
+        print(line)
+    print("@ you  E exit  $ loot  R ritual  ! ambush  o empty  * cleared")
+
     slow_print("\nPress Enter to continue...")
     input()
 
+# ----------------------------
+# Full map (force-directed layout, drawn in ASCII around the player)
+# ----------------------------
+MAP_WIDTH = 60       # viewport size in characters
+MAP_HEIGHT = 20
+MAP_SCALE_X = 4.0    # characters per layout unit
+MAP_SCALE_Y = 2.0
+ROOM_GLYPHS = {"exit": "E", "loot": "$", "ritual": "R", "fight": "!", "empty": "o"}
+
+def _relax(adj, pos, movable, steps, temp=1.0):
+    # Fruchterman–Reingold: tunnels pull rooms to distance ~1, nearby rooms push apart.
+    # Repulsion only looks at the 3x3 block of grid cells around a room, so a step is O(n).
+    for step in range(steps):
+        grid = {}
+        for i, (x, y) in enumerate(pos):
+            grid.setdefault((int(x // 2), int(y // 2)), []).append(i)
+        t = temp * (1 - step / steps) + 0.01
+        for v in movable:
+            x, y = pos[v]
+            fx = fy = 0.0
+            cx, cy = int(x // 2), int(y // 2)
+            for gx in (cx - 1, cx, cx + 1):
+                for gy in (cy - 1, cy, cy + 1):
+                    for u in grid.get((gx, gy), ()):
+                        if u == v:
+                            continue
+                        dx, dy = x - pos[u][0], y - pos[u][1]
+                        dd = dx * dx + dy * dy or 0.01
+                        fx += dx / dd
+                        fy += dy / dd
+            for u in adj[v]:
+                dx, dy = pos[u][0] - x, pos[u][1] - y
+                dist = math.hypot(dx, dy) or 0.01
+                fx += dx * dist
+                fy += dy * dist
+            force = math.hypot(fx, fy) or 1.0
+            move = min(force, t)
+            pos[v] = [x + fx / force * move, y + fy / force * move]
+
+def compute_layout(d, iterations=60):
+    adj = d["adj"]
+    n = len(adj)
+    side = math.sqrt(n) * 1.5
+    # seeded dungeons get the same starting layout every time they are rebuilt
+    rng = random.Random(d["seed"]) if "seed" in d else random
+    pos = [[rng.uniform(0, side), rng.uniform(0, side)] for _ in range(n)]
+    _relax(adj, pos, range(n), iterations, temp=side / 4)
+    d["layout"] = pos
+    return pos
+
+def update_layout(d, changed, steps=8):
+    # after a tunnel opens or collapses, only the rooms around it settle again
+    if "layout" not in d:
+        return
+    adj = d["adj"]
+    local = set(changed)
+    for v in changed:
+        local.update(adj[v])
+    _relax(adj, d["layout"], sorted(local), steps, temp=0.5)
+
+def ensure_layout(d):
+    # layouts are not saved: rebuild from the seed's base graph, then replay every
+    # shift so the rooms around each moved tunnel settle just as they did in play
+    if "layout" in d:
+        return d["layout"]
+    if "seed" not in d or "params" not in d:
+        return compute_layout(d)
+    num_rooms, extra_edges = d["params"]
+    replay = {"adj": generate_base_graph(d["seed"], num_rooms, extra_edges), "seed": d["seed"]}
+    compute_layout(replay)
+    for kind, a, b in d.get("shifts", []):
+        _replay_shift(replay["adj"], kind, a, b)
+        update_layout(replay, (a, b))
+    d["layout"] = replay["layout"]
+    return d["layout"]
+
+def _plot_line(grid, x0, y0, x1, y1):
+    # Bresenham, clipped to the viewport; never overwrites a room glyph
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+    err = dx + dy
+    while True:
+        if 0 <= y0 < MAP_HEIGHT and 0 <= x0 < MAP_WIDTH and grid[y0][x0] == " ":
+            grid[y0][x0] = "."
+        if x0 == x1 and y0 == y1:
+            return
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+
+def render_map(d):
+    pos = ensure_layout(d)
+    adj = d["adj"]
+    px, py = pos[d["current"]]
+    # layout units visible on each side of the player
+    half_w = MAP_WIDTH / MAP_SCALE_X / 2
+    half_h = MAP_HEIGHT / MAP_SCALE_Y / 2
+
+    def to_cell(v):
+        x, y = pos[v]
+        return int((x - px + half_w) * MAP_SCALE_X), int((y - py + half_h) * MAP_SCALE_Y)
+
+    visible = [v for v, (x, y) in enumerate(pos) if abs(x - px) <= half_w and abs(y - py) <= half_h]
+    grid = [[" "] * MAP_WIDTH for _ in range(MAP_HEIGHT)]
+    for v in visible:
+        for u in adj[v]:
+            _plot_line(grid, *to_cell(v), *to_cell(u))
+    for v in visible:
+        cx, cy = to_cell(v)
+        if 0 <= cy < MAP_HEIGHT and 0 <= cx < MAP_WIDTH:
+            room = _room_at(d, v)
+            glyph = ROOM_GLYPHS.get(room["type"], "o")
+            if room.get("cleared") and room["type"] != "exit":
+                glyph = "*"
+            grid[cy][cx] = "@" if v == d["current"] else glyph
+    border = "+" + "-" * MAP_WIDTH + "+"
+    return [border] + ["|" + "".join(row) + "|" for row in grid] + [border]
+
+# ----------------------------
+# Dungeon pool (layouts generated in the background)
+# ----------------------------
+POOL_DEPTH = 4  # ready layouts kept per (num_rooms, extra_edges)
+
+dungeon_pool = {
+    "layouts": {},         # "rooms:edges" -> list of ready dungeons
+    "loaded": {},          # "rooms:edges" -> dungeons read from the pool file, layout not built yet
+    "depth": POOL_DEPTH,
+    "hits": 0,
+    "misses": 0,
+    "refills": 0,
+    "refill_seconds": 0.0,
+}
+_pool_lock = threading.Lock()
+_pool_wakeup = threading.Event()
+_pool_worker = None
+
+def _pool_key(num_rooms, extra_edges):
+    return f"{num_rooms}:{extra_edges}"
+
+def _refill_pool():
+    # top up every known key to the target depth, one layout at a time
+    while True:
+        with _pool_lock:
+            depth = dungeon_pool["depth"]
+            short = [k for k, q in dungeon_pool["layouts"].items() if len(q) < depth]
+        if not short:
+            return
+        for key in short:
+            num_rooms, extra_edges = map(int, key.split(":"))
+            t0 = time.perf_counter()
+            with _pool_lock:
+                loaded = dungeon_pool["loaded"].get(key)
+                fresh = loaded.pop(0) if loaded else None
+            if fresh is None:
+                fresh = generate_dungeon(num_rooms, extra_edges)
+            ensure_layout(fresh)
+            elapsed = time.perf_counter() - t0
+            with _pool_lock:
+                dungeon_pool["layouts"][key].append(fresh)
+                dungeon_pool["refills"] += 1
+                dungeon_pool["refill_seconds"] += elapsed
+
+def _pool_loop():
+    while True:
+        _pool_wakeup.wait()
+        _pool_wakeup.clear()
+        _refill_pool()
+
+def start_dungeon_pool(params=((14, 5),), depth=POOL_DEPTH, filename=POOLFILE):
+    global _pool_worker
+    with _pool_lock:
+        dungeon_pool["depth"] = depth
+        for num_rooms, extra_edges in params:
+            dungeon_pool["layouts"].setdefault(_pool_key(num_rooms, extra_edges), [])
+    load_dungeon_pool(filename)
+    if _pool_worker is None:
+        _pool_worker = threading.Thread(target=_pool_loop, name="dungeon-pool", daemon=True)
+        _pool_worker.start()
+    _pool_wakeup.set()
+
+def take_dungeon(num_rooms=14, extra_edges=5):
+    # pop a ready layout; only generate inline if the pool ran dry
+    key = _pool_key(num_rooms, extra_edges)
+    with _pool_lock:
+        ready = dungeon_pool["layouts"].setdefault(key, [])
+        d = ready.pop(0) if ready else None
+        dungeon_pool["hits" if d else "misses"] += 1
+    _pool_wakeup.set()
+    if d is None:
+        d = generate_dungeon(num_rooms, extra_edges)
+        compute_layout(d)
+    return d
+
+def pool_stats():
+    with _pool_lock:
+        taken = dungeon_pool["hits"] + dungeon_pool["misses"]
+        refills = dungeon_pool["refills"]
+        return {
+            "ready": {k: len(q) for k, q in dungeon_pool["layouts"].items()},
+            "hits": dungeon_pool["hits"],
+            "misses": dungeon_pool["misses"],
+            "hit_rate": dungeon_pool["hits"] / taken if taken else 0.0,
+            "avg_refill_ms": 1000 * dungeon_pool["refill_seconds"] / refills if refills else 0.0,
+        }
+
+def save_dungeon_pool(filename=POOLFILE):
+    with _pool_lock:
+        layouts = {
+            k: [pack_dungeon(d) for d in q + dungeon_pool["loaded"].get(k, [])]
+            for k, q in dungeon_pool["layouts"].items()
+        }
+    try:
+        tmp = filename + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(layouts, f, ensure_ascii=False)
+        os.replace(tmp, filename)
+    except Exception as e:
+        print("[Failed to save dungeon pool:]", e)
+
+def load_dungeon_pool(filename=POOLFILE):
+    if not Path(filename).is_file():
+        return
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            layouts = json.load(f)
+    except Exception as e:
+        print("[Failed to load dungeon pool:]", e)
+        return
+    if not isinstance(layouts, dict):
+        return
+    # the worker builds their layouts before they are handed out
+    with _pool_lock:
+        for key, q in layouts.items():
+            if isinstance(q, list):
+                dungeon_pool["layouts"].setdefault(key, [])
+                loaded = dungeon_pool["loaded"].setdefault(key, [])
+                loaded.extend(unpack_dungeon(d) for d in q[:max(0, dungeon_pool["depth"] - len(loaded))])
+
+# ----------------------------
+# Dungeon graph import / export (edge lists)
+# ----------------------------
+# Text format, one record per line:
+#   dungeon <num_rooms> <start> <exit> <current>
+#   room <id> <type> <cleared 0|1>
+#   edge <a> <b>
+# Binary format: EDGE_MAGIC, header, one type byte and one cleared byte per room,
+# then the edges as little-endian int32 pairs written in chunks of EDGE_CHUNK.
+EDGE_MAGIC = b"GGDE"
+EDGE_HEADER = struct.Struct("<5I")  # num_rooms, start, exit, current, num_edges
+EDGE_CHUNK = 65536                  # edges per chunk
+ROOM_TYPE_CODES = list(ROOM_KINDS)  # type byte -> room type
+
+def _iter_edges(adj):
+    for u, nbs in enumerate(adj):
+        for v in nbs:
+            if u < v:
+                yield u, v
+
+def _blank_dungeon(num_rooms, start, exit_room, current, max_rooms):
+    # max_rooms comes from the file size: a connected dungeon needs num_rooms - 1
+    # edges, so a header claiming more rooms than that is corrupt
+    if not 0 < num_rooms <= max_rooms:
+        raise ValueError(f"header claims {num_rooms} rooms, the file holds at most {max_rooms}")
+    if not (0 <= start < num_rooms and 0 <= exit_room < num_rooms and 0 <= current < num_rooms):
+        raise ValueError("header rooms out of range")
+    rooms = {i: make_room(i, "empty") for i in range(num_rooms)}
+    return {
+        "adj": [[] for _ in range(num_rooms)],
+        "rooms": rooms,
+        "start": start,
+        "exit": exit_room,
+        "current": current,
+    }
+
+def _set_room(d, rid, kind, cleared):
+    if kind not in ROOM_KINDS:
+        raise ValueError(f"unknown room type {kind!r}")
+    d["rooms"][rid] = make_room(rid, kind, cleared)
+
+def _add_edge(adj, a, b):
+    # duplicates are caught once at the end by _finish_import, not per insert
+    if a == b or not (0 <= a < len(adj) and 0 <= b < len(adj)):
+        raise ValueError(f"bad edge {a} {b}")
+    adj[a].append(b)
+    adj[b].append(a)
+
+def _finish_import(d, layout=True):
+    for rid, nbs in enumerate(d["adj"]):
+        if len(set(nbs)) != len(nbs):
+            raise ValueError(f"duplicate tunnel at room {rid}")
+    # every room must hang together and the gate must be reachable
+    _, dist = bfs_farthest(d["adj"], d["start"])
+    if -1 in dist:
+        raise ValueError("dungeon graph is not connected")
+    if not is_reachable(d["adj"], d["current"], d["exit"]):
+        raise ValueError("exit gate is unreachable")
+    start_room = d["rooms"][d["start"]]
+    if start_room["type"] == "empty":
+        d["rooms"][d["start"]] = make_start_room(d["start"], start_room["cleared"])
+    d["trail"] = [d["current"]]
+    if layout:
+        compute_layout(d)
+    return d
+
+def export_edge_list(d, filename):
+    n = len(d["adj"])
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(f"dungeon {n} {d['start']} {d['exit']} {d['current']}\n")
+        for rid in range(n):
+            room = _room_at(d, rid)
+            f.write(f"room {rid} {room['type']} {int(bool(room.get('cleared')))}\n")
+        for u, v in _iter_edges(d["adj"]):
+            f.write(f"edge {u} {v}\n")
+
+def import_edge_list(filename, layout=True):
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            head = f.readline().split()
+            if len(head) != 5 or head[0] != "dungeon":
+                raise ValueError("missing 'dungeon' header line")
+            # every edge line is at least "edge a b\n"
+            max_rooms = os.path.getsize(filename) // len("edge 0 1\n") + 1
+            d = _blank_dungeon(*map(int, head[1:]), max_rooms)
+            adj = d["adj"]
+            for line in f:
+                parts = line.split()
+                if not parts or parts[0].startswith("#"):
+                    continue
+                if parts[0] == "edge":
+                    _add_edge(adj, int(parts[1]), int(parts[2]))
+                elif parts[0] == "room":
+                    rid = int(parts[1])
+                    if rid not in d["rooms"]:
+                        raise ValueError(f"room {rid} out of range")
+                    _set_room(d, rid, parts[2], parts[3] == "1")
+                else:
+                    raise ValueError(f"unknown record {parts[0]!r}")
+        return _finish_import(d, layout)
+    except (OSError, ValueError, IndexError) as e:
+        print("[Failed to import dungeon:]", e)
+        return None
+
+def _write_chunk(f, chunk):
+    if sys.byteorder == "big":
+        chunk.byteswap()
+    f.write(chunk.tobytes())
+
+def export_edge_array(d, filename):
+    adj = d["adj"]
+    n = len(adj)
+    num_edges = sum(len(nbs) for nbs in adj) // 2
+    types = bytes(ROOM_TYPE_CODES.index(_room_at(d, rid)["type"]) for rid in range(n))
+    cleared = bytes(int(bool(_room_at(d, rid).get("cleared"))) for rid in range(n))
+    with open(filename, "wb") as f:
+        f.write(EDGE_MAGIC)
+        f.write(EDGE_HEADER.pack(n, d["start"], d["exit"], d["current"], num_edges))
+        f.write(types)
+        f.write(cleared)
+        chunk = array("i")
+        for u, v in _iter_edges(adj):
+            chunk.append(u)
+            chunk.append(v)
+            if len(chunk) >= 2 * EDGE_CHUNK:
+                _write_chunk(f, chunk)
+                chunk = array("i")
+        _write_chunk(f, chunk)
+
+def import_edge_array(filename, layout=True):
+    try:
+        with open(filename, "rb") as f:
+            if f.read(len(EDGE_MAGIC)) != EDGE_MAGIC:
+                raise ValueError("not a dungeon edge array")
+            n, start, exit_room, current, num_edges = EDGE_HEADER.unpack(f.read(EDGE_HEADER.size))
+            expected = len(EDGE_MAGIC) + EDGE_HEADER.size + 2 * n + 8 * num_edges
+            if os.path.getsize(filename) < expected:
+                raise ValueError("file is shorter than its header says")
+            d = _blank_dungeon(n, start, exit_room, current, num_edges + 1)
+            types = f.read(n)
+            cleared = f.read(n)
+            if len(types) != n or len(cleared) != n:
+                raise ValueError("truncated room table")
+            for rid in range(n):
+                if types[rid] >= len(ROOM_TYPE_CODES):
+                    raise ValueError(f"bad room type code {types[rid]}")
+                if types[rid] or cleared[rid]:
+                    _set_room(d, rid, ROOM_TYPE_CODES[types[rid]], bool(cleared[rid]))
+            adj = d["adj"]
+            left = num_edges
+            while left > 0:
+                take = min(left, EDGE_CHUNK)
+                chunk = array("i")
+                chunk.frombytes(f.read(8 * take))
+                if len(chunk) != 2 * take:
+                    raise ValueError("truncated edge array")
+                if sys.byteorder == "big":
+                    chunk.byteswap()
+                it = iter(chunk)
+                for a, b in zip(it, it):
+                    _add_edge(adj, a, b)
+                left -= take
+        return _finish_import(d, layout)
+    except (OSError, ValueError, struct.error) as e:
+        print("[Failed to import dungeon:]", e)
+        return None
+
+# ----------------------------
+# Run history (SQLite, written off the game loop)
+# ----------------------------
+HISTORY_BATCH = 1000  # rows per transaction
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    player TEXT,
+    outcome TEXT,
+    gold INTEGER,
+    health INTEGER,
+    sigils INTEGER,
+    moves INTEGER,
+    rooms_cleared INTEGER,
+    ended REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_gold ON runs (gold DESC);
+CREATE TABLE IF NOT EXISTS room_events (
+    run_id TEXT,
+    room INTEGER,
+    kind TEXT,
+    outcome TEXT,
+    mode TEXT,
+    difficulty INTEGER,
+    hp_lost INTEGER,
+    gold INTEGER
+);
+CREATE INDEX IF NOT EXISTS room_events_by_run ON room_events (run_id);
+CREATE INDEX IF NOT EXISTS room_events_by_kind ON room_events (kind, mode, difficulty);
+-- running totals so the leaderboard never scans room_events
+CREATE TABLE IF NOT EXISTS event_totals (
+    kind TEXT,
+    mode TEXT,
+    difficulty INTEGER,
+    count INTEGER,
+    wins INTEGER,
+    hp_lost INTEGER,
+    PRIMARY KEY (kind, mode, difficulty)
+);
+"""
+
+_history_queue = queue.Queue()
+_history = {"disabled": False, "error": None}  # error: waiting for the game loop to report it
+_history_lock = threading.Lock()
+_history_worker = None
+_history_file = HISTORYFILE
+
+def _history_connect(filename):
+    con = sqlite3.connect(filename)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(HISTORY_SCHEMA)
+    return con
+
+def _write_history(con, batch):
+    runs = [row for kind, row in batch if kind == "run"]
+    events = [row for kind, row in batch if kind == "event"]
+    with con:
+        con.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", runs)
+        con.executemany("INSERT INTO room_events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", events)
+        con.executemany(
+            "INSERT INTO event_totals VALUES (?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (kind, mode, difficulty) DO UPDATE SET "
+            "count = count + 1, wins = wins + excluded.wins, hp_lost = hp_lost + excluded.hp_lost",
+            [(kind, mode or "", difficulty or 0, int(outcome in ("you", "win")), hp_lost)
+             for _, _, kind, outcome, mode, difficulty, hp_lost, _ in events],
+        )
+
+def _history_loop(filename):
+    con = None
+    while True:
+        batch = [_history_queue.get()]
+        while len(batch) < HISTORY_BATCH:
+            try:
+                batch.append(_history_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if not _history["disabled"]:
+                if con is None:
+                    con = _history_connect(filename)
+                _write_history(con, batch)
+        except Exception as e:
+            # an unwritable history file must not stall the game: stop recording
+            # and leave the error for report_history_errors
+            with _history_lock:
+                _history["disabled"] = True
+                _history["error"] = e
+            if con is not None:
+                con.close()
+                con = None
+        finally:
+            for _ in batch:
+                _history_queue.task_done()
+
+def start_history(filename=HISTORYFILE):
+    global _history_worker, _history_file
+    if _history_worker is None:
+        _history_file = filename
+        _history_worker = threading.Thread(target=_history_loop, args=(filename,),
+                                           name="run-history", daemon=True)
+        _history_worker.start()
+
+def flush_history():
+    # wait until everything queued so far is on disk (or dropped, if history broke)
+    if _history_worker is not None:
+        _history_queue.join()
+
+def report_history_errors():
+    with _history_lock:
+        error, _history["error"] = _history["error"], None
+    if error:
+        slow_print(f"[Failed to record run history, no longer recording: {error}]")
+
+def record_room_event(d, room_id, kind, outcome=None, mode=None, difficulty=None, hp_lost=0, gold=0):
+    if _history["disabled"]:
+        return
+    start_history()
+    _history_queue.put(("event", (d.get("run_id"), room_id, kind, outcome, mode, difficulty, hp_lost, gold)))
+
+def record_run(d, outcome):
+    if _history["disabled"]:
+        return
+    start_history()
+    cleared = sum(1 for room in d["rooms"].values() if room.get("cleared"))
+    _history_queue.put(("run", (d.get("run_id") or uuid.uuid4().hex, player["name"], outcome,
+                                player["gold"], player["health"], player["sigils"],
+                                d.get("moves", 0), cleared, time.time())))
+
+def _history_query(sql, args=()):
+    flush_history()
+    if _history["disabled"] or not Path(_history_file).is_file():
+        return []
+    con = _history_connect(_history_file)
+    try:
+        return con.execute(sql, args).fetchall()
+    finally:
+        con.close()
+
+def top_runs(n=10):
+    return _history_query(
+        "SELECT player, outcome, gold, sigils, moves FROM runs ORDER BY gold DESC LIMIT ?", (n,))
+
+def ritual_win_rates():
+    # mode -> (rituals played, fraction won by the player)
+    rows = _history_query("SELECT mode, count, wins FROM event_totals WHERE kind = 'ritual' ORDER BY mode")
+    return {mode: (count, wins / count) for mode, count, wins in rows}
+
+def fight_hp_loss():
+    # difficulty -> average HP lost per ambush
+    rows = _history_query(
+        "SELECT difficulty, count, hp_lost FROM event_totals WHERE kind = 'fight' ORDER BY difficulty")
+    return {difficulty: hp_lost / count for difficulty, count, hp_lost in rows}
+
+def hall_of_fame():
+    divider()
+    slow_print("The village scribe unrolls the Hall of Fame.")
+    runs = top_runs(5)
+    if not runs:
+        slow_print("No runs recorded yet. Go make history.")
+        return
+    for i, (name, outcome, gold, sigils, moves) in enumerate(runs, 1):
+        print(f"{i}. {name:<12} {outcome:<6} gold={gold:<5} sigils={sigils}/3  moves={moves}")
+    for mode, (count, rate) in ritual_win_rates().items():
+        label = "Game 1" if mode == "game1" else "Game 2"
+        print(f"Rituals ({label}): {count} played, {rate:.0%} won")
+    for difficulty, hp in fight_hp_loss().items():
+        print(f"Ambush difficulty {difficulty}: {hp:.1f} HP lost on average")
+
+# ----------------------------
+# Visit history (every move of every run, stored column by column)
+# ----------------------------
+# Moves are buffered in typed arrays and written to MOVESFILE every MOVE_CHUNK
+# records. Each chunk stores its columns one after the other, every column
+# delta + zigzag + varint encoded, so rooms and timesteps that change a little
+# per move take a byte or two. Queries decode one column of one chunk at a time.
+MOVE_CHUNK = 4096
+MOVE_MAGIC = b"GGMV"
+MOVE_COLUMNS = ("run", "step", "room", "hp", "kind")
+MOVE_KINDS = ("move", "loot", "ritual", "fight", "empty", "exit", "shift")
+TRAIL_LENGTH = 12
+
+move_log = {col: array("q") for col in MOVE_COLUMNS}
+
+def _run_number(d):
+    return int(d.get("run_id", "0")[:15] or "0", 16)
+
+def _zigzag_varints(values):
+    out = bytearray()
+    prev = 0
+    for v in values:
+        delta = v - prev
+        prev = v
+        z = (delta << 1) ^ (delta >> 63)
+        while z >= 0x80:
+            out.append((z & 0x7F) | 0x80)
+            z >>= 7
+        out.append(z)
+    return bytes(out)
+
+def _unzigzag_varints(buf, count):
+    values = array("q", bytes(8 * count))
+    pos = 0
+    prev = 0
+    for i in range(count):
+        z = shift = 0
+        while True:
+            b = buf[pos]
+            pos += 1
+            z |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        prev += (z >> 1) ^ -(z & 1)
+        values[i] = prev
+    return values
+
+# Breadcrumbs live in a fixed-size ring, d["trail_ring"], while the dungeon is
+# played. d["trail"] is only the saved form: it seeds the ring on the first move
+# after a new run or a load, and snapshot_state writes it back from the ring.
+def _trail_push(d, room):
+    ring = d.get("trail_ring")
+    if ring is None:
+        ring = {"rooms": array("q", [0] * TRAIL_LENGTH), "head": 0, "size": 0}
+        d["trail_ring"] = ring
+        for crumb in d.pop("trail", [d["current"]])[-TRAIL_LENGTH:]:
+            _trail_push(d, crumb)
+    last = ring["rooms"][(ring["head"] - 1) % TRAIL_LENGTH]
+    if ring["size"] and last == room:
+        return
+    ring["rooms"][ring["head"]] = room
+    ring["head"] = (ring["head"] + 1) % TRAIL_LENGTH
+    ring["size"] = min(ring["size"] + 1, TRAIL_LENGTH)
+
+def breadcrumbs(d):
+    # last TRAIL_LENGTH rooms of this run, oldest first
+    ring = d.get("trail_ring")
+    if ring is None:
+        return list(d.get("trail", [d["current"]])[-TRAIL_LENGTH:])
+    start = ring["head"] - ring["size"]
+    return [ring["rooms"][(start + i) % TRAIL_LENGTH] for i in range(ring["size"])]
+
+def log_move(d, room, kind="move"):
+    if kind == "move":
+        _trail_push(d, room)
+    move_log["run"].append(_run_number(d))
+    move_log["step"].append(d.get("moves", 0))
+    move_log["room"].append(room)
+    move_log["hp"].append(player["health"])
+    move_log["kind"].append(MOVE_KINDS.index(kind))
+    if len(move_log["run"]) >= MOVE_CHUNK:
+        flush_moves()
+
+def flush_moves(filename=MOVESFILE):
+    count = len(move_log["run"])
+    if not count:
+        return
+    try:
+        with open(filename, "ab") as f:
+            f.write(MOVE_MAGIC + struct.pack("<I", count))
+            for col in MOVE_COLUMNS:
+                data = _zigzag_varints(move_log[col])
+                f.write(struct.pack("<I", len(data)))
+                f.write(data)
+    except OSError as e:
+        print("[Failed to write move history:]", e)
+    for col in MOVE_COLUMNS:
+        move_log[col] = array("q")
+
+def iter_move_chunks(filename=MOVESFILE, columns=MOVE_COLUMNS):
+    # yields {column: array} per chunk, decoding only the columns asked for
+    if not Path(filename).is_file():
+        return
+    with open(filename, "rb") as f:
+        while True:
+            head = f.read(len(MOVE_MAGIC) + 4)
+            if len(head) < len(MOVE_MAGIC) + 4 or head[:4] != MOVE_MAGIC:
+                return
+            (count,) = struct.unpack("<I", head[4:])
+            chunk = {}
+            for col in MOVE_COLUMNS:
+                (size,) = struct.unpack("<I", f.read(4))
+                if col in columns:
+                    chunk[col] = _unzigzag_varints(f.read(size), count)
+                else:
+                    f.seek(size, 1)
+            yield chunk
+
+def visit_heatmap(filename=MOVESFILE, run_id=None):
+    # room -> number of times it was walked into, over every run (or just one)
+    counts = {}
+    run = int(run_id[:15], 16) if run_id else None
+    move = MOVE_KINDS.index("move")
+    for chunk in iter_move_chunks(filename, ("run", "room", "kind")):
+        for r, room, kind in zip(chunk["run"], chunk["room"], chunk["kind"]):
+            if kind == move and (run is None or r == run):
+                counts[room] = counts.get(room, 0) + 1
+    return counts
+
+def revisit_counts(filename=MOVESFILE):
+    # run number -> moves that walked back into a room already seen that run
+    seen = {}
+    revisits = {}
+    move = MOVE_KINDS.index("move")
+    for chunk in iter_move_chunks(filename, ("run", "room", "kind")):
+        for r, room, kind in zip(chunk["run"], chunk["room"], chunk["kind"]):
+            if kind != move:
+                continue
+            rooms = seen.setdefault(r, set())
+            if room in rooms:
+                revisits[r] = revisits.get(r, 0) + 1
+            else:
+                rooms.add(room)
+                revisits.setdefault(r, 0)
+    return revisits
+
+# ----------------------------
+# Persistent game state (undo, branching, lookahead for bots)
+# ----------------------------
+# A version is a small dict that is never changed after it is made. Rooms and
+# tunnels live in persistent vectors: tries of 32-wide tuples where an update
+# copies only the path to one leaf (O(log n)) and shares everything else with
+# the version it came from. Thousands of "what-if" versions can share one dungeon.
+PVEC_BITS = 5
+PVEC_WIDTH = 1 << PVEC_BITS
+PVEC_MASK = PVEC_WIDTH - 1
+
+def pvec_from(items):
+    # returns (size, shift, root)
+    nodes = [tuple(items[i:i + PVEC_WIDTH]) for i in range(0, len(items), PVEC_WIDTH)] or [()]
+    shift = 0
+    while len(nodes) > 1:
+        nodes = [tuple(nodes[i:i + PVEC_WIDTH]) for i in range(0, len(nodes), PVEC_WIDTH)]
+        shift += PVEC_BITS
+    return (len(items), shift, nodes[0])
+
+def pvec_get(vec, i):
+    size, shift, node = vec
+    if not 0 <= i < size:
+        raise IndexError(i)
+    while shift:
+        node = node[(i >> shift) & PVEC_MASK]
+        shift -= PVEC_BITS
+    return node[i & PVEC_MASK]
+
+def pvec_set(vec, i, value):
+    size, shift, root = vec
+    if not 0 <= i < size:
+        raise IndexError(i)
+
+    def put(node, level):
+        idx = (i >> level) & PVEC_MASK
+        child = value if level == 0 else put(node[idx], level - PVEC_BITS)
+        return node[:idx] + (child,) + node[idx + 1:]
+
+    return (size, shift, put(root, shift))
+
+def pvec_list(vec):
+    return [pvec_get(vec, i) for i in range(vec[0])]
+
+# dungeon fields that ride along unchanged (None for imported dungeons)
+PERSISTENT_META = ("seed", "params", "run_id")
+
+def freeze_state(state):
+    d = state["dungeon"]
+    p = state["player"]
+    n = len(d["adj"])
+    return {
+        **{key: d.get(key) for key in PERSISTENT_META},
+        "player": {**p, "inventory": tuple(p["inventory"])},
+        "adj": pvec_from([tuple(nbs) for nbs in d["adj"]]),
+        "rooms": pvec_from([dict(_room_at(d, rid)) for rid in range(n)]),
+        "start": d["start"],
+        "exit": d["exit"],
+        "current": d["current"],
+        "trail": tuple(breadcrumbs(d)),
+        "moves": d.get("moves", 0),
+        "shifts": tuple(tuple(shift) for shift in d.get("shifts", [])),
+        # layout rows are replaced, never edited, so the version can share them
+        "layout": tuple(d["layout"]) if "layout" in d else None,
+        "layout_shifts": len(d.get("shifts", [])),
+        "parent": None,
+    }
+
+def thaw_state(v):
+    # back to the mutable shape the game loop and save_game use
+    p = {**v["player"], "inventory": list(v["player"]["inventory"])}
+    state = {
+        "player": p,
+        "dungeon": {
+            **{key: v[key] for key in PERSISTENT_META if v.get(key) is not None},
+            "adj": [list(nbs) for nbs in pvec_list(v["adj"])],
+            "rooms": {str(rid): dict(room) for rid, room in enumerate(pvec_list(v["rooms"]))},
+            "start": v["start"],
+            "exit": v["exit"],
+            "current": v["current"],
+            "trail": list(v["trail"]),
+            "moves": v["moves"],
+            "shifts": [list(shift) for shift in v["shifts"]],
+        },
+    }
+    d = state["dungeon"]
+    if v.get("layout") is not None:
+        # the frozen layout plus the tunnels moved since the freeze
+        d["layout"] = list(v["layout"])
+        for kind, a, b in v["shifts"][v["layout_shifts"]:]:
+            update_layout(d, (a, b))
+    else:
+        ensure_layout(d)
+    return state
+
+def _next_version(v, **changes):
+    return {**v, **changes, "parent": v}
+
+def pundo(v):
+    return v["parent"] or v
+
+def pmove(v, room):
+    if room not in pvec_get(v["adj"], v["current"]):
+        raise ValueError(f"no tunnel from room {v['current']} to room {room}")
+    trail = v["trail"] if v["trail"] and v["trail"][-1] == room else (v["trail"] + (room,))[-TRAIL_LENGTH:]
+    return _next_version(v, current=room, trail=trail, moves=v["moves"] + 1)
+
+def pclear(v, rid):
+    room = pvec_get(v["rooms"], rid)
+    return _next_version(v, rooms=pvec_set(v["rooms"], rid, {**room, "cleared": True}))
+
+def pplayer(v, **changes):
+    return _next_version(v, player={**v["player"], **changes})
+
+def popen_tunnel(v, a, b):
+    adj = v["adj"]
+    if a == b or b in pvec_get(adj, a):
+        return v
+    adj = pvec_set(adj, a, pvec_get(adj, a) + (b,))
+    adj = pvec_set(adj, b, pvec_get(adj, b) + (a,))
+    return _next_version(v, adj=adj, shifts=v["shifts"] + (("open", a, b),))
+
+def pcollapse_tunnel(v, a, b):
+    # same fairness rule as dungeon_shift: never cut the way to the exit
+    adj = v["adj"]
+    if b not in pvec_get(adj, a):
+        return v
+    adj = pvec_set(adj, a, tuple(x for x in pvec_get(adj, a) if x != b))
+    adj = pvec_set(adj, b, tuple(x for x in pvec_get(adj, b) if x != a))
+    if not _preachable(adj, v["current"], v["exit"]):
+        return v
+    return _next_version(v, adj=adj, shifts=v["shifts"] + (("collapse", a, b),))
+
+def pshift(v):
+    # dungeon_shift for versions: one random shortcut opens or one safe tunnel collapses
+    adj = v["adj"]
+    n = adj[0]
+    if random.choice(["open", "collapse"]) == "open":
+        for _ in range(20):
+            a, b = random.sample(range(n), 2)
+            if b not in pvec_get(adj, a):
+                return popen_tunnel(v, a, b)
+        return v
+    candidates = [(u, w) for u in range(n) for w in pvec_get(adj, u) if u < w]
+    random.shuffle(candidates)
+    for u, w in candidates:
+        nv = pcollapse_tunnel(v, u, w)
+        if nv is not v:
+            return nv
+    return v
+
+def _preachable(adj, start, target):
+    seen = {start}
+    q = deque([start])
+    while q:
+        x = q.popleft()
+        if x == target:
+            return True
+        for u in pvec_get(adj, x):
+            if u not in seen:
+                seen.add(u)
+                q.append(u)
+    return False
+
 # ----------------------------
 # Dungeon exploration
 # ----------------------------
 def enter_dungeon(state):
     # generate dungeon if none
     if "dungeon" not in state or not state["dungeon"]:
-        state["dungeon"] = generate_dungeon() # generate_dungeon(num_rooms=30, extra_edges=10)  larger dungeon, can be adjusted
+        state["dungeon"] = take_dungeon() # take_dungeon(num_rooms=30, extra_edges=10)  larger dungeon, can be adjusted (start_dungeon_pool with the same params)
         state["dungeon"]["trail"] = [state["dungeon"]["current"]]
+        state["dungeon"]["run_id"] = uuid.uuid4().hex
         slow_print("The dungeon shifts into place beneath the village...\n")
+        log_move(state["dungeon"], state["dungeon"]["current"])
 
     d = state["dungeon"]
-    d.setdefault("trail", [d["current"]])
+    d.setdefault("run_id", uuid.uuid4().hex)
 
     while True:
+        report_save_errors()
+        report_history_errors()
         if player["health"] <= 0:
             slow_print("\nYou collapse. The dungeon wins.\n")
+            record_run(d, "death")
             state["dungeon"] = None
             return
 
@@ -614,20 +2057,26 @@ def enter_dungeon(state):
 
         # run event once per room unless exit
         if room["type"] != "exit" and not room.get("cleared", False):
+            hp_before, gold_before = player["health"], player["gold"]
+            outcome = {}
             if room["type"] == "loot":
                 event_loot_cache()
 
             elif room["type"] == "ritual":
                 result = event_goblin_ritual()
-                if result == "ritual_done":
+                outcome = {"outcome": result["winner"], "mode": result["mode"]}
+                if result["result"] == "ritual_done":
                     slow_print("\nThe dungeon shudders...")
                     msg = dungeon_shift(state["dungeon"])
+                    log_move(d, room_id, "shift")
                     slow_print(msg)
 
             elif room["type"] == "fight":
                 print(ENEMY_ART)
                 slow_print("A shadow lunges!")
-                result = number_battle(difficulty=1 + (player["sigils"] // 1))
+                difficulty = 1 + (player["sigils"] // 1)
+                result = number_battle(difficulty=difficulty)
+                outcome = {"outcome": result["result"], "difficulty": difficulty}
                 if result["result"] == "win":
                     reward = 15 + random.randint(0, 25)
                     player["gold"] += reward
@@ -638,7 +2087,12 @@ def enter_dungeon(state):
             else:
                 slow_print("Nothing here but echoes.")
 
-            room["cleared"] = True
+            room = {**room, "cleared": True}
+            d["rooms"][_room_key(d, room_id)] = room
+            record_room_event(d, room_id, room["type"],
+                              hp_lost=max(0, hp_before - player["health"]),
+                              gold=player["gold"] - gold_before, **outcome)
+            log_move(d, room_id, room["type"])
 
         # exit room logic
         if room["type"] == "exit":
@@ -647,6 +2101,7 @@ def enter_dungeon(state):
                 slow_print("The sockets flare. The gate unlocks.")
                 slow_print("You step into moonlight. You escaped the Goblin King’s Graph.")
                 slow_print("\n=== YOU WIN ===\n")
+                record_run(d, "win")
                 # reset dungeon for next run
                 state["dungeon"] = None
                 return
@@ -671,7 +2126,7 @@ def enter_dungeon(state):
 
         if choice == "p":
             divider()
-            trail = state["dungeon"].get("trail", [])
+            trail = breadcrumbs(d)
             if len(trail) <= 1:
                 slow_print("Breadcrumbs: (you just arrived here)")
             else:
@@ -688,7 +2143,8 @@ def enter_dungeon(state):
         if choice == "s":
             state["player"] = player
             state["dungeon"] = d
-            save_game(state)
+            save_in_background(state)
+            slow_print(f"[Saving to {SAVEFILE}...]")
             continue
 
         if choice.isdigit():
@@ -698,14 +2154,14 @@ def enter_dungeon(state):
 
                 d = state["dungeon"]
                 d["current"] = next_room
+                d["moves"] = d.get("moves", 0) + 1
+
+                # --- Breadcrumbs (and the move history) ---
+                log_move(d, next_room)
 
-                # --- Breadcrumbs ---
-                trail = d.setdefault("trail", [])
-                if not trail or trail[-1] != next_room:
-                    trail.append(next_room)
-                    # keep last 12 rooms
-                    if len(trail) > 12:
-                        del trail[:-12]
+                if d["moves"] % AUTOSAVE_EVERY == 0:
+                    state["player"] = player
+                    save_in_background(state)
 
             else:
                 slow_print("Nope.")
@@ -803,6 +2259,8 @@ def noticeboard():
 
 def village(state):
     while True:
+        report_save_errors()
+        report_history_errors()
         divider()
         slow_print("You stroll through the small village. Traders call out from stalls.")
         print(SHOP_ART)
@@ -819,7 +2277,8 @@ def village(state):
         print("5) Show stats")
         print("6) Save Game")
         print("7) Load Game")
-        print("8) Quit (autosave)")
+        print("8) Hall of Fame")
+        print("9) Quit (autosave)")
 
         choice = input("> ").strip()
         if choice == "1":
@@ -834,7 +2293,8 @@ def village(state):
             show_stats()
         elif choice == "6":
             state["player"] = player
-            save_game(state)
+            save_in_background(state)
+            slow_print(f"[Saving to {SAVEFILE}...]")
         elif choice == "7":
             loaded = load_game()
             if loaded:
@@ -843,9 +2303,13 @@ def village(state):
                 player.update(state.get("player", {}))
                 slow_print("Loaded.")
         elif choice == "8":
+            hall_of_fame()
+        elif choice == "9":
             slow_print("Autosaving and exiting...")
             state["player"] = player
-            save_game(state)
+            save_in_background(state)
+            wait_for_saves()
+            report_save_errors()
             slow_print("Goodbye.")
             raise SystemExit
         else:
@@ -893,9 +2357,19 @@ def _jsonify_dungeon(state):
 
 if __name__ == "__main__":
     random.seed()
+    if "--spectate" in sys.argv[1:-1]:
+        start_spectating(sys.argv[sys.argv.index("--spectate") + 1])
+    start_dungeon_pool()
     state = {}
-    intro(state)
-
-    # ensure dungeon keys are serializable
-    _jsonify_dungeon(state)
-    village(state)
+    try:
+        intro(state)
+
+        # ensure dungeon keys are serializable
+        _jsonify_dungeon(state)
+        village(state)
+    finally:
+        # Quit, Ctrl-C or EOF on input: keep what the background workers hold
+        save_dungeon_pool()
+        flush_history()
+        report_history_errors()
+        flush_moves()